@@ -12,15 +12,38 @@ Usage:
 """
 
 from flask import Flask, render_template, request, jsonify, send_file, redirect, url_for
+from flask.json.provider import JSONProvider
 import os
 import sys
 import json
-import uuid
+import threading
+import time
 from datetime import datetime
 from werkzeug.utils import secure_filename
 from PIL import Image
 import io
-import base64
+import itertools
+import shutil
+import sqlite3
+import tempfile
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+try:
+    from pybase64 import b64decode  # SIMD-accelerated decoder
+except ImportError:
+    from base64 import b64decode
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    from gevent import monkey as gevent_monkey
+except ImportError:
+    gevent_monkey = None
 
 # Add core module to path
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'core'))
@@ -32,11 +55,49 @@ app = Flask(__name__,
 
 app.secret_key = os.environ.get('SECRET_KEY', 'tti-sensor-analysis-dev-key')
 
+
+class OrjsonProvider(JSONProvider):
+    """Flask JSON provider backed by orjson for request parsing and responses"""
+    
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS).decode()
+    
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+    
+    def response(self, *args, **kwargs):
+        # Hand orjson's bytes straight to the response, skipping a str round-trip
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(
+            orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS),
+            mimetype='application/json'
+        )
+
+
+if orjson is not None:
+    app.json = OrjsonProvider(app)
+
 # Configuration
 UPLOAD_FOLDER = 'uploads'
 OUTPUT_FOLDER = 'output'
 CALIBRATION_FOLDER = 'calibrations'
-ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'bmp', 'gif', 'webp'}
+ALLOWED_SUFFIXES = ('.png', '.jpg', '.jpeg', '.bmp', '.gif', '.webp')
+BASE64_CHUNK_SIZE = 4 * 65536  # must be a multiple of 4
+STREAM_CHUNK_SIZE = 65536
+
+# Raw image uploads accepted by /api/analyze, mapped to the saved file extension
+RAW_IMAGE_EXTENSIONS = {
+    'image/png': '.png',
+    'image/jpeg': '.jpg',
+    'image/bmp': '.bmp',
+    'image/gif': '.gif',
+    'image/webp': '.webp'
+}
+
+# Limits on zip archives sent to the batch endpoint (uncompressed sizes)
+MAX_ZIP_IMAGES = 100
+MAX_ZIP_MEMBER_SIZE = 16 * 1024 * 1024
+MAX_ZIP_TOTAL_SIZE = 64 * 1024 * 1024
 
 # Create directories
 for folder in [UPLOAD_FOLDER, OUTPUT_FOLDER, CALIBRATION_FOLDER]:
@@ -49,43 +110,170 @@ app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max
 CALIBRATION_PATH = os.path.join(CALIBRATION_FOLDER, 'calibration.json')
 analyzer = TTISensorAnalyzer(CALIBRATION_PATH)
 
-# Analysis history (in-memory for simplicity)
-analysis_history = []
+# Worker pool for batch analysis (image decode and numba kernels release the GIL).
+# Under gevent (wsgi.py) patched threads are greenlets, so use gevent's pool of
+# real OS threads; it also keeps the worker serving other requests meanwhile.
+if gevent_monkey is not None and gevent_monkey.is_module_patched('threading'):
+    from gevent.threadpool import ThreadPool
+    executor = ThreadPool(os.cpu_count())
+else:
+    executor = ThreadPoolExecutor(max_workers=os.cpu_count())
+
+# Analysis history (SQLite in WAL mode, shared across gunicorn workers)
+HISTORY_DB_PATH = os.path.join(OUTPUT_FOLDER, 'history.db')
+
+
+def open_history_db(path):
+    """Open the history database, creating the table if needed"""
+    conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.execute(
+        'CREATE TABLE IF NOT EXISTS history ('
+        'id INTEGER PRIMARY KEY AUTOINCREMENT, ts TEXT, status TEXT, '
+        'label TEXT, confidence REAL, days TEXT)'
+    )
+    return conn
+
+
+history_db = open_history_db(HISTORY_DB_PATH)
+
+
+def add_history(result):
+    """Record an analysis result in the history database"""
+    analysis = result['analysis']
+    history_db.execute(
+        'INSERT INTO history (ts, status, label, confidence, days) VALUES (?, ?, ?, ?, ?)',
+        (result['timestamp'], analysis['status'], analysis['label'],
+         analysis['confidence'], analysis['days_remaining'])
+    )
+
+
+def recent_history(count):
+    """Return the most recent history entries, oldest first"""
+    rows = history_db.execute(
+        'SELECT id, ts, status, label, confidence, days FROM history '
+        'ORDER BY id DESC LIMIT ?', (count,)
+    ).fetchall()
+    return [
+        {
+            'id': row[0],
+            'timestamp': row[1],
+            'status': row[2],
+            'label': row[3],
+            'confidence': row[4],
+            'days_remaining': row[5]
+        }
+        for row in reversed(rows)
+    ]
+
+
+def history_total():
+    """Return the number of recorded analyses"""
+    # Rows are never deleted, so the AUTOINCREMENT max id is the count (O(1))
+    return history_db.execute('SELECT COALESCE(MAX(id), 0) FROM history').fetchone()[0]
+
+
+# Per-process sequence so names stay unique even when clock reads coincide
+upload_counter = itertools.count()
+
+
+def unique_prefix():
+    """Return a cheap prefix that is unique per saved file (not unpredictable)"""
+    return (f"{time.monotonic_ns():x}_{os.getpid():x}_"
+            f"{threading.get_ident():x}_{next(upload_counter):x}")
 
 
 def allowed_file(filename):
     """Check if file extension is allowed"""
-    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+    return filename.lower().endswith(ALLOWED_SUFFIXES)
 
 
 def save_uploaded_file(file):
     """Save uploaded file and return path"""
     if file and allowed_file(file.filename):
-        filename = f"{uuid.uuid4().hex}_{secure_filename(file.filename)}"
+        filename = f"{unique_prefix()}_{secure_filename(file.filename)}"
         filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
         file.save(filepath)
         return filepath
     return None
 
 
+def save_image_stream(stream, mimetype):
+    """Copy a raw image request body to disk and return path"""
+    extension = RAW_IMAGE_EXTENSIONS.get(mimetype.lower())
+    if extension is None:
+        return None
+    
+    filepath = os.path.join(app.config['UPLOAD_FOLDER'], f"{unique_prefix()}{extension}")
+    
+    with open(filepath, 'wb') as f:
+        shutil.copyfileobj(stream, f, length=STREAM_CHUNK_SIZE)
+    
+    return filepath
+
+
+def save_zip_images(file):
+    """Extract allowed images from an uploaded zip archive and return paths
+    
+    Raises ValueError if the archive exceeds the image count or
+    uncompressed size limits; nothing is extracted in that case.
+    """
+    filepaths = []
+    with zipfile.ZipFile(file.stream) as archive:
+        members = [
+            member for member in archive.infolist()
+            if not member.is_dir() and allowed_file(os.path.basename(member.filename))
+        ]
+        
+        # Check declared sizes up front (reads never exceed them) to stop zip bombs
+        if len(members) > MAX_ZIP_IMAGES:
+            raise ValueError(f'Archive contains more than {MAX_ZIP_IMAGES} images')
+        total_size = 0
+        for member in members:
+            if member.file_size > MAX_ZIP_MEMBER_SIZE:
+                raise ValueError(f'Image {member.filename} is too large')
+            total_size += member.file_size
+            if total_size > MAX_ZIP_TOTAL_SIZE:
+                raise ValueError('Archive is too large when uncompressed')
+        
+        for member in members:
+            name = os.path.basename(member.filename)
+            filename = f"{unique_prefix()}_{secure_filename(name)}"
+            filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+            with archive.open(member) as src, open(filepath, 'wb') as dst:
+                shutil.copyfileobj(src, dst, length=STREAM_CHUNK_SIZE)
+            filepaths.append(filepath)
+    return filepaths
+
+
 def process_base64_image(base64_data):
     """Process base64 encoded image and save to file"""
+    filepath = None
     try:
         # Remove data URL prefix if present
         if ',' in base64_data:
-            base64_data = base64_data.split(',')[1]
+            base64_data = base64_data.split(',', 1)[1]
         
-        # Decode and save
-        image_data = base64.b64decode(base64_data)
-        filename = f"{uuid.uuid4().hex}.png"
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+        # Drop any whitespace/line breaks so chunks stay 4-char aligned
+        # (only when present, as stripping copies the whole payload)
+        if any(ch in base64_data for ch in ' \t\r\n'):
+            base64_data = ''.join(base64_data.split())
         
-        with open(filepath, 'wb') as f:
-            f.write(image_data)
+        # Decode in chunks straight to disk instead of holding the whole payload
+        with tempfile.NamedTemporaryFile(dir=app.config['UPLOAD_FOLDER'],
+                                         prefix=f"{unique_prefix()}_",
+                                         suffix='.png', delete=False) as f:
+            filepath = f.name
+            for i in range(0, len(base64_data), BASE64_CHUNK_SIZE):
+                f.write(b64decode(base64_data[i:i + BASE64_CHUNK_SIZE]))
         
         return filepath
     except Exception as e:
         print(f"Error processing base64 image: {e}")
+        # Don't leave a partially decoded file behind
+        if filepath and os.path.exists(filepath):
+            os.remove(filepath)
         return None
 
 
@@ -97,7 +285,7 @@ def index():
     has_calibration = analyzer.has_calibration()
     return render_template('index.html', 
                          has_calibration=has_calibration,
-                         history=analysis_history[-10:])
+                         history=recent_history(10))
 
 
 @app.route('/mobile')
@@ -116,7 +304,7 @@ def calibrate_page():
 def api_analyze():
     """
     API endpoint for image analysis
-    Accepts: file upload OR base64 image OR JSON with image data
+    Accepts: raw image body OR file upload OR base64 image OR JSON with image data
     Returns: JSON analysis results
     """
     filepath = None
@@ -124,7 +312,18 @@ def api_analyze():
     
     try:
         # Handle different input types
-        if request.content_type and 'multipart/form-data' in request.content_type:
+        if request.mimetype.startswith('image/'):
+            # Raw image body, streamed straight to disk
+            filepath = save_image_stream(request.stream, request.mimetype)
+            
+            # Get region if provided
+            if 'region' in request.args:
+                try:
+                    region = json.loads(request.args['region'])
+                except:
+                    pass
+                    
+        elif request.content_type and 'multipart/form-data' in request.content_type:
             # File upload
             if 'image' not in request.files:
                 return jsonify({'error': 'No image file provided'}), 400
@@ -155,10 +354,10 @@ def api_analyze():
                 region = data['region']
         else:
             # Try to get raw base64 data
-            data = request.get_data(as_text=True)
+            data = request.get_data()
             if data:
                 try:
-                    json_data = json.loads(data)
+                    json_data = app.json.loads(data)
                     if 'image' in json_data:
                         filepath = process_base64_image(json_data['image'])
                 except:
@@ -167,21 +366,17 @@ def api_analyze():
         if not filepath:
             return jsonify({'error': 'Could not process image. Please try again.'}), 400
         
-        # Perform analysis
-        result = analyzer.analyze_image(filepath, region)
+        # Perform analysis (?metrics=all adds Euclidean/Manhattan diagnostics,
+        # ?fast=1 converts the mean color to LAB with OpenCV)
+        all_metrics = request.args.get('metrics') == 'all'
+        fast_mode = request.args.get('fast') == '1'
+        result = analyzer.analyze_image(filepath, region, all_metrics, fast_mode)
         
         if 'error' in result:
             return jsonify({'error': result['error']}), 500
         
         # Add to history
-        analysis_history.append({
-            'id': len(analysis_history) + 1,
-            'timestamp': result['timestamp'],
-            'status': result['analysis']['status'],
-            'label': result['analysis']['label'],
-            'confidence': result['analysis']['confidence'],
-            'days_remaining': result['analysis']['days_remaining']
-        })
+        add_history(result)
         
         return jsonify({
             'success': True,
@@ -192,6 +387,60 @@ def api_analyze():
         return jsonify({'error': f'Analysis failed: {str(e)}'}), 500
 
 
+@app.route('/api/analyze/batch', methods=['POST'])
+def api_analyze_batch():
+    """
+    API endpoint for analyzing a series of images in parallel
+    Accepts: multipart form with several 'images' files and/or a zip 'archive'
+    Returns: JSON list of analysis results, in upload order
+    """
+    try:
+        filepaths = []
+        
+        for file in request.files.getlist('images'):
+            filepath = save_uploaded_file(file)
+            if filepath:
+                filepaths.append(filepath)
+        
+        if 'archive' in request.files:
+            try:
+                filepaths.extend(save_zip_images(request.files['archive']))
+            except zipfile.BadZipFile:
+                return jsonify({'error': 'Invalid zip archive'}), 400
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+        
+        if not filepaths:
+            return jsonify({'error': 'No images provided'}), 400
+        
+        # Same region applies to every image in the batch
+        region = None
+        if 'region' in request.form:
+            try:
+                region = json.loads(request.form['region'])
+            except:
+                pass
+        
+        all_metrics = request.args.get('metrics') == 'all'
+        fast_mode = request.args.get('fast') == '1'
+        analyze = partial(analyzer.analyze_image, region=region,
+                          all_metrics=all_metrics, fast_mode=fast_mode)
+        results = list(executor.map(analyze, filepaths))
+        
+        # Add successful analyses to history
+        for result in results:
+            if 'error' not in result:
+                add_history(result)
+        
+        return jsonify({
+            'success': True,
+            'results': results
+        })
+        
+    except Exception as e:
+        return jsonify({'error': f'Batch analysis failed: {str(e)}'}), 500
+
+
 @app.route('/api/calibrate', methods=['POST'])
 def api_calibrate():
     """
@@ -311,8 +560,8 @@ def api_use_default_calibration():
 def api_history():
     """Get analysis history"""
     return jsonify({
-        'history': analysis_history[-50:],
-        'total': len(analysis_history)
+        'history': recent_history(50),
+        'total': history_total()
     })
 
 
@@ -328,8 +577,7 @@ def upload_calibration():
             return render_template('upload_calibration.html', error='No file selected')
         
         try:
-            content = file.read().decode('utf-8')
-            calibration_data = json.loads(content)
+            calibration_data = app.json.loads(file.read())
             
             if analyzer.save_calibration(calibration_data):
                 return redirect(url_for('index'))
@@ -358,4 +606,4 @@ if __name__ == '__main__':
     print("\n  Press Ctrl+C to stop\n")
     print("=" * 70 + "\n")
     
-    app.run(debug=debug, host='0.0.0.0', port=port)
+    app.run(debug=debug, host='0.0.0.0', port=port, threaded=True)
@@ -0,0 +1,88 @@
+"""
+TTI Sensor Analyzer Numba Kernels
+JIT-compiled region mean and Delta E pipeline, used when OpenCV is unavailable
+
+Author: Piyush Tandon
+Supervisor: Dr. Juming Tang
+University of Washington
+"""
+
+import math
+import numpy as np
+
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+
+def _f(t):
+    """Lab f(t) piecewise transform"""
+    if t > 0.008856:
+        return math.pow(t, 1.0 / 3.0)
+    return (7.787 * t) + (16.0 / 116.0)
+
+
+def _gamma(c):
+    """sRGB gamma expansion"""
+    if c > 0.04045:
+        return math.pow((c + 0.055) / 1.055, 2.4)
+    return c / 12.92
+
+
+def _rgb_to_lab(r, g, b, rgb_to_xyz, white):
+    """Convert a single RGB color to LAB (same math as rgb_to_lab_batch)"""
+    rgb = (_gamma(r / 255.0), _gamma(g / 255.0), _gamma(b / 255.0))
+    
+    # Convert to XYZ, normalize for the white point, then to Lab
+    f = np.empty(3, dtype=np.float64)
+    for i in range(3):
+        xyz = (rgb_to_xyz[i, 0] * rgb[0] + rgb_to_xyz[i, 1] * rgb[1]
+               + rgb_to_xyz[i, 2] * rgb[2])
+        f[i] = _f(xyz / white[i])
+    
+    return (116.0 * f[1]) - 16.0, 500.0 * (f[0] - f[1]), 200.0 * (f[1] - f[2])
+
+
+def _analyze_pixels(pixels, ref_lab, rgb_to_xyz, white):
+    """Compute the mean color of already cropped pixels and its Delta E to each reference
+    
+    Returns (sample_rgb, delta_e).
+    """
+    sample = np.empty(3, dtype=np.int32)
+    count = pixels.shape[0] * pixels.shape[1]
+    if count == 0:
+        sample[:] = 128  # Default gray if region is invalid
+    else:
+        sr, sg, sb = 0, 0, 0
+        for i in range(pixels.shape[0]):
+            for j in range(pixels.shape[1]):
+                sr += np.int64(pixels[i, j, 0])
+                sg += np.int64(pixels[i, j, 1])
+                sb += np.int64(pixels[i, j, 2])
+        sample[0] = sr // count
+        sample[1] = sg // count
+        sample[2] = sb // count
+    
+    L, a, b = _rgb_to_lab(float(sample[0]), float(sample[1]), float(sample[2]),
+                          rgb_to_xyz, white)
+    
+    k = ref_lab.shape[0]
+    delta_e = np.empty(k, dtype=np.float64)
+    for n in range(k):
+        dL = L - ref_lab[n, 0]
+        da = a - ref_lab[n, 1]
+        db = b - ref_lab[n, 2]
+        delta_e[n] = math.sqrt(dL * dL + da * da + db * db)
+    
+    return sample, delta_e
+
+
+if njit is not None:
+    _f = njit(cache=True)(_f)
+    _gamma = njit(cache=True)(_gamma)
+    _rgb_to_lab = njit(cache=True)(_rgb_to_lab)
+    analyze_pixels = njit(cache=True, nogil=True)(_analyze_pixels)
+else:
+    # The pure-Python loops would be far slower than the NumPy path
+    analyze_pixels = None
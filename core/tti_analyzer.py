@@ -14,6 +14,102 @@ import os
 from datetime import datetime
 import math
 
+try:
+    import cv2
+except ImportError:
+    cv2 = None
+
+try:
+    from ._kernels import analyze_pixels
+except ImportError:
+    from _kernels import analyze_pixels
+
+# sRGB (D65) -> XYZ conversion matrix
+RGB_TO_XYZ = np.array([
+    [0.4124564, 0.3575761, 0.1804375],
+    [0.2126729, 0.7151522, 0.0721750],
+    [0.0193339, 0.1191920, 0.9503041]
+])
+
+# D65 reference white point
+D65_WHITE = np.array([0.95047, 1.0, 1.08883])
+
+# Images larger than this on either side are decoded at half resolution
+REDUCED_DECODE_THRESHOLD = 2000
+
+
+def _decode_image(path):
+    """Decode an image file to a uint8 HxWx3 RGB array
+    
+    Returns (img_array, scale) where scale is the factor the decoded
+    image was reduced by relative to the file's full resolution.
+    """
+    if cv2 is not None:
+        try:
+            # Only the mean color is needed, so large images decode at half size
+            with Image.open(path) as header:
+                w, h = header.size
+            scale = 1.0
+            flags = cv2.IMREAD_COLOR
+            if max(w, h) > REDUCED_DECODE_THRESHOLD:
+                flags = cv2.IMREAD_REDUCED_COLOR_2
+                scale = 0.5
+            
+            # Match PIL, which does not apply EXIF orientation
+            img = cv2.imread(path, flags | cv2.IMREAD_IGNORE_ORIENTATION)
+            if img is not None:
+                return cv2.cvtColor(img, cv2.COLOR_BGR2RGB), scale
+        except Exception:
+            pass
+    
+    # Fall back to PIL for formats OpenCV can't read
+    with Image.open(path) as img:
+        if img.mode != 'RGB':
+            img = img.convert('RGB')
+        return np.array(img), 1.0
+
+
+def _scale_region(region, scale):
+    """Scale region coordinates to match a resized image"""
+    if scale == 1.0:
+        return region
+    return {
+        'x': int(region['x'] * scale),
+        'y': int(region['y'] * scale),
+        'width': max(1, int(region['width'] * scale)),
+        'height': max(1, int(region['height'] * scale))
+    }
+
+
+def _crop_region(img_array, region):
+    """Slice a region out of an image array, clamped to the image bounds"""
+    height, width = img_array.shape[:2]
+    x, y = region['x'], region['y']
+    
+    # Ensure bounds are valid (plain comparisons avoid min/max call overhead)
+    if x > width - 1:
+        x = width - 1
+    if x < 0:
+        x = 0
+    if y > height - 1:
+        y = height - 1
+    if y < 0:
+        y = 0
+    
+    x2 = x + region['width']
+    if x2 > width:
+        x2 = width
+    if x2 < 0:
+        x2 = 0
+    y2 = y + region['height']
+    if y2 > height:
+        y2 = height
+    if y2 < 0:
+        y2 = 0
+    
+    return img_array[y:y2, x:x2]
+
+
 class TTISensorAnalyzer:
     """Core analyzer for Time-Temperature Indicator sensors"""
     
@@ -37,6 +133,7 @@ class TTISensorAnalyzer:
         """Initialize analyzer with calibration data"""
         self.calibration_path = calibration_path
         self.calibration = None
+        self._ref_cache = None
         self.load_calibration()
     
     def load_calibration(self):
@@ -45,10 +142,12 @@ class TTISensorAnalyzer:
             try:
                 with open(self.calibration_path, 'r') as f:
                     self.calibration = json.load(f)
+                self._invalidate_reference_cache()
                 return True
             except Exception as e:
                 print(f"Error loading calibration: {e}")
                 self.calibration = None
+        self._invalidate_reference_cache()
         return False
     
     def save_calibration(self, calibration_data):
@@ -57,6 +156,7 @@ class TTISensorAnalyzer:
             with open(self.calibration_path, 'w') as f:
                 json.dump(calibration_data, f, indent=2)
             self.calibration = calibration_data
+            self._invalidate_reference_cache()
             return True
         except Exception as e:
             print(f"Error saving calibration: {e}")
@@ -68,38 +168,64 @@ class TTISensorAnalyzer:
     
     def get_reference_colors(self):
         """Get reference colors from calibration or defaults"""
-        if self.calibration and 'colors' in self.calibration:
-            return self.calibration['colors']
-        return self.DEFAULT_COLORS
+        return self._reference_cache()[0]
     
-    def extract_region_color(self, image, region):
-        """Extract average color from a region of an image"""
-        if isinstance(image, str):
-            img = Image.open(image)
-        else:
-            img = image
+    def _reference_cache(self):
+        """Get (ref_colors, ref_rgb_array, ref_lab_array) for the current calibration
         
-        if img.mode != 'RGB':
-            img = img.convert('RGB')
+        The three are published together as one tuple so concurrent requests
+        never pair new reference colors with stale arrays; callers should use
+        the tuple they read rather than re-reading the attribute.
+        """
+        if self.calibration and 'colors' in self.calibration:
+            ref_colors = self.calibration['colors']
+        else:
+            ref_colors = self.DEFAULT_COLORS
         
-        img_array = np.array(img)
+        # Rebuild cached arrays if the reference set has been replaced
+        cache = self._ref_cache
+        if cache is None or cache[0] is not ref_colors:
+            ref_rgb = np.array([ref['rgb'] for ref in ref_colors.values()],
+                               dtype=np.float32)
+            cache = (ref_colors, ref_rgb, self.rgb_to_lab_batch(ref_rgb))
+            self._ref_cache = cache
         
-        x, y, w, h = region['x'], region['y'], region['width'], region['height']
+        return cache
+    
+    def _invalidate_reference_cache(self):
+        """Recompute cached reference RGB/LAB arrays for the current calibration"""
+        self._ref_cache = None
+        self._reference_cache()
+    
+    def extract_region_color(self, image, region):
+        """Extract average color from a region of an image
         
-        # Ensure bounds are valid
-        x = max(0, min(x, img_array.shape[1] - 1))
-        y = max(0, min(y, img_array.shape[0] - 1))
-        x2 = max(0, min(x + w, img_array.shape[1]))
-        y2 = max(0, min(y + h, img_array.shape[0]))
+        image may be a file path, a PIL Image, or an already decoded
+        uint8 RGB array (used as-is, with no copy).
+        """
+        if isinstance(image, np.ndarray):
+            img_array = image
+        elif isinstance(image, str):
+            img_array, scale = _decode_image(image)
+            region = _scale_region(region, scale)
+        else:
+            img = image
+            if img.mode != 'RGB':
+                img = img.convert('RGB')
+            img_array = np.array(img)
         
         # Extract region
-        region_pixels = img_array[y:y2, x:x2]
+        region_pixels = _crop_region(img_array, region)
         
         if region_pixels.size == 0:
             return [128, 128, 128]  # Default gray if region is invalid
         
-        # Calculate average color
-        avg_color = np.mean(region_pixels.reshape(-1, 3), axis=0)
+        # Calculate average color; small regions aren't worth the OpenCV call
+        if cv2 is None or region_pixels.shape[0] * region_pixels.shape[1] < 256:
+            avg_color = np.mean(region_pixels, axis=(0, 1))
+        else:
+            # Channel order follows the array, which is already RGB
+            avg_color = cv2.mean(region_pixels)[:3]
         return [int(c) for c in avg_color]
     
     def color_distance_euclidean(self, color1, color2):
@@ -110,62 +236,75 @@ class TTISensorAnalyzer:
         """Calculate Manhattan distance between two RGB colors"""
         return sum(abs(a - b) for a, b in zip(color1, color2))
     
-    def rgb_to_lab(self, rgb):
-        """Convert RGB to LAB color space for Delta E calculation"""
+    def rgb_to_lab_batch(self, rgb_array):
+        """Convert an (N, 3) array of RGB colors to LAB in one vectorized pass"""
         # Normalize RGB to [0, 1]
-        r, g, b = [x / 255.0 for x in rgb]
+        rgb = np.asarray(rgb_array, dtype=np.float64).reshape(-1, 3) / 255.0
         
         # Apply gamma correction
-        def gamma(c):
-            return ((c + 0.055) / 1.055) ** 2.4 if c > 0.04045 else c / 12.92
-        
-        r, g, b = gamma(r), gamma(g), gamma(b)
+        rgb = np.where(rgb > 0.04045, ((rgb + 0.055) / 1.055) ** 2.4, rgb / 12.92)
         
-        # Convert to XYZ
-        x = r * 0.4124564 + g * 0.3575761 + b * 0.1804375
-        y = r * 0.2126729 + g * 0.7151522 + b * 0.0721750
-        z = r * 0.0193339 + g * 0.1191920 + b * 0.9503041
-        
-        # Normalize for D65 white point
-        x, y, z = x / 0.95047, y / 1.0, z / 1.08883
+        # Convert to XYZ and normalize for D65 white point
+        xyz = (rgb @ RGB_TO_XYZ.T) / D65_WHITE
         
         # Convert to Lab
-        def f(t):
-            return t ** (1/3) if t > 0.008856 else (7.787 * t) + (16 / 116)
+        f = np.where(xyz > 0.008856, np.cbrt(xyz), (7.787 * xyz) + (16 / 116))
+        fx, fy, fz = f[:, 0], f[:, 1], f[:, 2]
         
-        L = (116 * f(y)) - 16
-        a = 500 * (f(x) - f(y))
-        b_val = 200 * (f(y) - f(z))
+        L = (116 * fy) - 16
+        a = 500 * (fx - fy)
+        b_val = 200 * (fy - fz)
         
-        return [L, a, b_val]
+        return np.stack([L, a, b_val], axis=1)
+    
+    def rgb_to_lab(self, rgb):
+        """Convert RGB to LAB color space for Delta E calculation"""
+        return self.rgb_to_lab_batch([rgb])[0].tolist()
     
     def color_distance_delta_e(self, color1, color2):
         """Calculate Delta E (CIE76) distance between two RGB colors"""
-        lab1 = self.rgb_to_lab(color1)
-        lab2 = self.rgb_to_lab(color2)
-        return math.sqrt(sum((a - b) ** 2 for a, b in zip(lab1, lab2)))
+        lab1, lab2 = self.rgb_to_lab_batch([color1, color2])
+        return float(np.linalg.norm(lab1 - lab2))
     
-    def analyze_color(self, sample_color):
-        """Analyze a sample color against reference colors"""
-        ref_colors = self.get_reference_colors()
+    def analyze_color(self, sample_color, all_metrics=True):
+        """Analyze a sample color against reference colors
+        
+        Only Delta E is needed to pick a status; Euclidean and Manhattan
+        distances are diagnostic and skipped unless all_metrics is set.
+        """
+        ref_colors, ref_rgb, ref_lab = self._reference_cache()
         
+        # Only the sample needs converting; reference LAB values are cached
+        sample_rgb = np.asarray(sample_color, dtype=np.float32)
+        sample_lab = self.rgb_to_lab_batch(sample_rgb)[0]
+        delta_e_values = np.sqrt(((ref_lab - sample_lab) ** 2).sum(1))
+        
+        metrics = self._all_metrics(sample_rgb, ref_rgb) if all_metrics else {}
+        return self._distance_results(ref_colors, delta_e_values, **metrics)
+    
+    def _all_metrics(self, sample_rgb, ref_rgb):
+        """Calculate the diagnostic RGB distance metrics"""
+        sample_rgb = np.asarray(sample_rgb, dtype=np.float32)
+        return {
+            'euclidean_values': np.sqrt(((ref_rgb - sample_rgb) ** 2).sum(1)),
+            'manhattan_values': np.abs(ref_rgb - sample_rgb).sum(1)
+        }
+    
+    def _distance_results(self, ref_colors, delta_e_values,
+                          euclidean_values=None, manhattan_values=None):
+        """Build per-status distance results from distance arrays"""
         results = {}
         
-        for status, ref_data in ref_colors.items():
-            ref_rgb = ref_data['rgb']
-            
-            # Calculate distances using all three metrics
-            euclidean = self.color_distance_euclidean(sample_color, ref_rgb)
-            manhattan = self.color_distance_manhattan(sample_color, ref_rgb)
-            delta_e = self.color_distance_delta_e(sample_color, ref_rgb)
-            
+        for i, (status, ref_data) in enumerate(ref_colors.items()):
             results[status] = {
-                'euclidean': euclidean,
-                'manhattan': manhattan,
-                'delta_e': delta_e,
-                'reference_rgb': ref_rgb,
+                'delta_e': float(delta_e_values[i]),
+                'reference_rgb': ref_data['rgb'],
                 'reference_name': ref_data.get('name', status)
             }
+            if euclidean_values is not None:
+                results[status]['euclidean'] = float(euclidean_values[i])
+            if manhattan_values is not None:
+                results[status]['manhattan'] = float(manhattan_values[i])
         
         return results
     
@@ -195,19 +334,19 @@ class TTISensorAnalyzer:
             'days_remaining': f"{self.STATUS_LABELS[best_status]['days_min']}-{self.STATUS_LABELS[best_status]['days_max']}"
         }
     
-    def analyze_image(self, image_path, region=None):
-        """Analyze an image and return freshness status"""
+    def analyze_image(self, image_path, region=None, all_metrics=False, fast_mode=False):
+        """Analyze an image and return freshness status
+        
+        fast_mode converts the region's mean color to LAB with OpenCV
+        instead of the NumPy rgb_to_lab conversion.
+        """
         try:
-            img = Image.open(image_path)
-            
-            if img.mode != 'RGB':
-                img = img.convert('RGB')
-            
-            img_array = np.array(img)
+            img_array, scale = _decode_image(image_path)
             
             # If no region specified, use center portion
             if region is None:
                 h, w = img_array.shape[:2]
+                h, w = int(h / scale), int(w / scale)
                 center_x = w // 4
                 center_y = h // 4
                 region = {
@@ -217,11 +356,40 @@ class TTISensorAnalyzer:
                     'height': h // 2
                 }
             
-            # Extract sample color
-            sample_color = self.extract_region_color(img, region)
+            # Map the region onto the (possibly reduced) decoded image
+            sample_region = _scale_region(region, scale)
             
-            # Analyze against references
-            distance_results = self.analyze_color(sample_color)
+            if fast_mode and cv2 is not None:
+                # Convert the region's mean color with OpenCV instead of rgb_to_lab
+                ref_colors, ref_rgb, ref_lab = self._reference_cache()
+                region_pixels = _crop_region(img_array, sample_region)
+                if region_pixels.size == 0:
+                    mean_rgb = (128.0, 128.0, 128.0)  # Default gray if region is invalid
+                else:
+                    mean_rgb = cv2.mean(region_pixels)[:3]
+                sample_color = [int(c) for c in mean_rgb]
+                
+                # Float input gives L in [0, 100] and signed a, b directly
+                sample_lab = cv2.cvtColor(np.float32(mean_rgb).reshape(1, 1, 3) / 255,
+                                          cv2.COLOR_RGB2LAB).reshape(3)
+                delta_e = np.sqrt(((ref_lab - sample_lab) ** 2).sum(1))
+                metrics = self._all_metrics(sample_color, ref_rgb) if all_metrics else {}
+                distance_results = self._distance_results(ref_colors, delta_e, **metrics)
+            elif cv2 is None and analyze_pixels is not None:
+                # Without OpenCV's SIMD mean, a JIT-compiled pass beats NumPy
+                ref_colors, ref_rgb, ref_lab = self._reference_cache()
+                sample, delta_e = analyze_pixels(
+                    _crop_region(img_array, sample_region), ref_lab,
+                    RGB_TO_XYZ, D65_WHITE)
+                sample_color = [int(c) for c in sample]
+                metrics = self._all_metrics(sample, ref_rgb) if all_metrics else {}
+                distance_results = self._distance_results(ref_colors, delta_e, **metrics)
+            else:
+                # Extract sample color
+                sample_color = self.extract_region_color(img_array, sample_region)
+                
+                # Analyze against references
+                distance_results = self.analyze_color(sample_color, all_metrics)
             
             # Determine status using Delta E (most perceptually accurate)
             status_result = self.determine_status(distance_results, 'delta_e')
@@ -244,9 +412,9 @@ class TTISensorAnalyzer:
                 },
                 'distances': {
                     status: {
-                        'euclidean': round(data['euclidean'], 2),
-                        'manhattan': round(data['manhattan'], 2),
-                        'delta_e': round(data['delta_e'], 2)
+                        metric: round(data[metric], 2)
+                        for metric in ('euclidean', 'manhattan', 'delta_e')
+                        if metric in data
                     }
                     for status, data in distance_results.items()
                 },
@@ -0,0 +1,12 @@
+"""
+TTI Sensor Analysis - WSGI Entry Point
+Production entry point for gunicorn with gevent workers
+
+Usage:
+    gunicorn -k gevent -w 4 --worker-connections 200 wsgi:app
+"""
+
+from gevent import monkey
+monkey.patch_all()
+
+from app import app  # noqa: E402